@@ -0,0 +1,396 @@
+import argparse
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+
+from aws_utils import client
+from notifier import Notifier, SMTP_USER, SMTP_PASSWORD
+
+# GetMetricData accepts at most 500 queries per request
+MAX_QUERIES_PER_CALL = 500
+
+DEFAULT_RULES = [
+    {"name": "high-cpu", "metric": "CPUUtilization", "threshold": 80, "clear": 70, "for_cycles": 3},
+    {"name": "network-out-spike", "metric": "NetworkOut", "kind": "rate", "threshold": 300, "clear": 100},
+]
+
+
+class Rule:
+    """
+    An alert rule evaluated per instance.
+
+    kind="threshold" compares the metric value itself; kind="rate" compares the
+    percent change since the previous datapoint. The alert fires once the value
+    has breached `threshold` for `for_cycles` consecutive datapoints and only
+    resolves after it crosses back past `clear` (hysteresis).
+    """
+
+    def __init__(self, name, metric, threshold, clear=None, kind="threshold",
+                 above=True, for_cycles=1, namespace="AWS/EC2", statistic="Average"):
+        if kind not in ("threshold", "rate"):
+            raise ValueError(f"Unknown rule kind: {kind}")
+        if for_cycles < 1:
+            raise ValueError(f"Rule {name}: for_cycles must be at least 1")
+        if clear is not None and (clear > threshold if above else clear < threshold):
+            side = "at or below" if above else "at or above"
+            raise ValueError(f"Rule {name}: clear must be {side} threshold")
+        self.name = name
+        self.metric = metric
+        self.threshold = threshold
+        self.clear = threshold if clear is None else clear
+        self.kind = kind
+        self.above = above
+        self.for_cycles = for_cycles
+        self.series = (namespace, metric, statistic)
+
+    def breached(self, value):
+        return value > self.threshold if self.above else value < self.threshold
+
+    def cleared(self, value):
+        return value <= self.clear if self.above else value >= self.clear
+
+
+def load_rules(path=None):
+    """Load rules from a JSON list of rule dicts, or use DEFAULT_RULES."""
+    if path:
+        with open(path) as f:
+            specs = json.load(f)
+    else:
+        specs = DEFAULT_RULES
+    rules = [Rule(**spec) for spec in specs]
+
+    names = [rule.name for rule in rules]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate rule names: {', '.join(duplicates)}")
+    return rules
+
+
+class MetricFetcher:
+    """
+    Fetches new datapoints of each (instance, series) with GetMetricData.
+
+    Each cycle costs ceil(instances * series / 500) API calls no matter how
+    many rules use those series, and only datapoints newer than the last one
+    seen are returned.
+    """
+
+    def __init__(self, series, period=300):
+        self.series = sorted(set(series))
+        self.period = period
+        self.cloudwatch = client("cloudwatch")
+        self.ec2 = client("ec2")
+        self.instance_ids = []
+        self.last_seen = {}
+        self.last_end = None
+
+    def refresh_instances(self):
+        """Reload the list of running instances."""
+        paginator = self.ec2.get_paginator("describe_instances")
+        pages = paginator.paginate(
+            Filters=[{"Name": "instance-state-name", "Values": ["running"]}]
+        )
+        self.instance_ids = [
+            instance["InstanceId"]
+            for page in pages
+            for reservation in page["Reservations"]
+            for instance in reservation["Instances"]
+        ]
+        active = set(self.instance_ids)
+        self.last_seen = {k: v for k, v in self.last_seen.items() if k[0] in active}
+        return self.instance_ids
+
+    def fetch(self):
+        """
+        Return new datapoints as a list of {series: {instance_id: (timestamp, value)}}
+        batches, one per timestamp in ascending order, so every datapoint is
+        evaluated even when polling is slower than the metric period.
+
+        The window ends on a period boundary so only finished periods are
+        evaluated. No API calls are made until a new period has completed,
+        and a failed call leaves the window open for the next cycle.
+        """
+        now = datetime.now(timezone.utc)
+        end = now - timedelta(seconds=now.timestamp() % self.period)
+        if end == self.last_end:
+            return []
+        if self.last_end is None:
+            start = end - timedelta(seconds=self.period * 3)
+        else:
+            # Overlap one period so late-arriving datapoints are not missed
+            start = self.last_end - timedelta(seconds=self.period)
+
+        keys = [(i, s) for s in self.series for i in self.instance_ids]
+        new_points = defaultdict(dict)
+        for offset in range(0, len(keys), MAX_QUERIES_PER_CALL):
+            chunk = keys[offset:offset + MAX_QUERIES_PER_CALL]
+            queries = [
+                {
+                    "Id": f"m{n}",
+                    "MetricStat": {
+                        "Metric": {
+                            "Namespace": namespace,
+                            "MetricName": metric,
+                            "Dimensions": [{"Name": "InstanceId", "Value": instance_id}],
+                        },
+                        "Period": self.period,
+                        "Stat": statistic,
+                    },
+                    "ReturnData": True,
+                }
+                for n, (instance_id, (namespace, metric, statistic)) in enumerate(chunk)
+            ]
+
+            kwargs = {
+                "MetricDataQueries": queries,
+                "StartTime": start,
+                "EndTime": end,
+                "ScanBy": "TimestampAscending",
+            }
+            while True:
+                response = self.cloudwatch.get_metric_data(**kwargs)
+                for result in response["MetricDataResults"]:
+                    key = chunk[int(result["Id"][1:])]
+                    seen = self.last_seen.get(key)
+                    for timestamp, value in zip(result["Timestamps"], result["Values"]):
+                        if seen is None or timestamp > seen:
+                            new_points[key][timestamp] = value
+                if "NextToken" not in response:
+                    break
+                kwargs["NextToken"] = response["NextToken"]
+
+        # Only mark the window done once every chunk has been fetched
+        self.last_end = end
+
+        batches = defaultdict(lambda: defaultdict(dict))
+        for (instance_id, series), points in new_points.items():
+            for timestamp, value in points.items():
+                batches[timestamp][series][instance_id] = (timestamp, value)
+            self.last_seen[(instance_id, series)] = max(points)
+        return [batches[timestamp] for timestamp in sorted(batches)]
+
+
+class AlertEngine:
+    """
+    Evaluates rules against metric batches and emits FIRING/RESOLVED events.
+
+    Each instance gets a fixed slot, and pending breach counts and firing
+    flags are kept as numpy arrays per rule. A rule is evaluated with a few
+    vectorised operations over the whole batch, so Python-level work is only
+    done for instances that actually change state; healthy instances and
+    alerts that stay firing cost nothing extra. A firing alert is not repeated
+    until it has resolved, which suppresses duplicates from flapping values.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.rules_by_series = defaultdict(list)
+        for rule in self.rules:
+            self.rules_by_series[rule.series].append(rule)
+        self.rate_series = {r.series for r in self.rules if r.kind == "rate"}
+
+        self.slots = {}
+        self.instance_ids = []
+        # rule -> consecutive breaches per slot, for alerts not yet firing
+        self.pending = {rule: np.zeros(0, dtype=np.int32) for rule in self.rules}
+        # rule -> firing flag per slot
+        self.firing = {rule: np.zeros(0, dtype=bool) for rule in self.rules}
+        # series -> previous value per slot (NaN if none), for rate rules
+        self.previous = {series: np.full(0, np.nan) for series in self.rate_series}
+
+    def _slot_array(self, instance_ids):
+        """Map instance ids to slots, growing the state arrays for new instances."""
+        for instance_id in instance_ids:
+            if instance_id not in self.slots:
+                self.slots[instance_id] = len(self.instance_ids)
+                self.instance_ids.append(instance_id)
+
+        size = len(self.instance_ids)
+        capacity = len(next(iter(self.firing.values()), ()))
+        if size > capacity:
+            grow = max(size, capacity * 2) - capacity
+            for rule in self.rules:
+                self.pending[rule] = np.concatenate([self.pending[rule], np.zeros(grow, dtype=np.int32)])
+                self.firing[rule] = np.concatenate([self.firing[rule], np.zeros(grow, dtype=bool)])
+            for series in self.previous:
+                self.previous[series] = np.concatenate([self.previous[series], np.full(grow, np.nan)])
+
+        return np.fromiter((self.slots[i] for i in instance_ids), dtype=np.intp, count=len(instance_ids))
+
+    def evaluate(self, batch):
+        events = []
+        for series, points in batch.items():
+            rules = self.rules_by_series.get(series)
+            if not rules or not points:
+                continue
+
+            instance_ids = list(points)
+            slots = self._slot_array(instance_ids)
+            values = np.fromiter((p[1] for p in points.values()), dtype=float, count=len(points))
+
+            if series in self.rate_series:
+                previous = self.previous[series]
+                prev = previous[slots]
+                # No change is computed without a previous value, or from zero
+                has_prev = ~np.isnan(prev) & (prev != 0)
+                rate_positions = np.flatnonzero(has_prev)
+                changes = (values[has_prev] - prev[has_prev]) / prev[has_prev] * 100
+                previous[slots] = values
+
+            for rule in rules:
+                if rule.kind == "rate":
+                    positions, current = rate_positions, changes
+                else:
+                    positions, current = None, values
+                rule_slots = slots if positions is None else slots[positions]
+
+                fired, resolved = self._step(rule, rule_slots, current)
+                for status, hits in (("FIRING", fired), ("RESOLVED", resolved)):
+                    if not len(hits):
+                        continue
+                    hit_positions = hits if positions is None else positions[hits]
+                    for position, value in zip(hit_positions.tolist(), current[hits].tolist()):
+                        instance_id = instance_ids[position]
+                        events.append(self._event(rule, status, instance_id, value, points[instance_id][0]))
+        return events
+
+    def _step(self, rule, slots, current):
+        """
+        Advance the rule's state for the given slots.
+        Returns positions (into `current`) that fired and that resolved.
+        """
+        breached = rule.breached(current)
+        cleared = rule.cleared(current)
+        firing = self.firing[rule][slots]
+        # A non-breaching datapoint breaks the streak of a pending alert
+        count = np.where(breached & ~firing, self.pending[rule][slots] + 1, 0)
+        fire = count >= rule.for_cycles
+        resolve = firing & ~breached & cleared
+
+        self.pending[rule][slots] = np.where(fire, 0, count)
+        self.firing[rule][slots] = (firing | fire) & ~resolve
+        return np.flatnonzero(fire), np.flatnonzero(resolve)
+
+    @staticmethod
+    def _event(rule, status, instance_id, value, timestamp, reason=None):
+        return {
+            "status": status,
+            "rule": rule.name,
+            "metric": rule.metric if rule.kind == "threshold" else f"{rule.metric} change %",
+            "instance_id": instance_id,
+            "value": value,
+            "timestamp": timestamp,
+            "reason": reason,
+        }
+
+    def prune(self, instance_ids):
+        """
+        Drop state for instances that are no longer running.
+        Returns RESOLVED events for alerts that were firing on them.
+        """
+        active = set(instance_ids)
+        keep = np.array([s for i, s in self.slots.items() if i in active], dtype=np.intp)
+        gone = np.array([s for i, s in self.slots.items() if i not in active], dtype=np.intp)
+
+        now = datetime.now(timezone.utc)
+        events = []
+        for rule in self.rules:
+            for slot in gone[self.firing[rule][gone]]:
+                events.append(self._event(rule, "RESOLVED", self.instance_ids[slot], None, now,
+                                          reason="instance no longer running"))
+
+        # Compact the remaining instances into the first slots
+        self.instance_ids = [self.instance_ids[s] for s in keep]
+        self.slots = {instance_id: n for n, instance_id in enumerate(self.instance_ids)}
+        for rule in self.rules:
+            self.pending[rule] = self.pending[rule][keep]
+            self.firing[rule] = self.firing[rule][keep]
+        for series in self.previous:
+            self.previous[series] = self.previous[series][keep]
+        return events
+
+
+def run_monitor(rules, notifier, interval=None, period=300, refresh_seconds=120):
+    """
+    Poll metrics every `interval` seconds (default: one `period`) and feed
+    alerts to the notifier. The instance list is reloaded every
+    `refresh_seconds`, independently of `interval`. Errors are logged and the
+    failed step is retried on the next cycle.
+    """
+    interval = interval or period
+    retry_seconds = min(interval, refresh_seconds)
+    engine = AlertEngine(rules)
+    fetcher = MetricFetcher([rule.series for rule in rules], period=period)
+
+    print(f"Monitor running with {len(rules)} rules... Press CTRL+C to exit")
+    refreshed = False
+    next_refresh = next_poll = time.time()
+    try:
+        while True:
+            now = time.time()
+            if now >= next_refresh:
+                try:
+                    for event in engine.prune(fetcher.refresh_instances()):
+                        notifier.add(event)
+                    refreshed = True
+                    next_refresh = now + refresh_seconds
+                except Exception as e:
+                    print(f"[{datetime.now()}] ❌ Instance refresh failed: {e}")
+                    next_refresh = now + retry_seconds
+
+            if not refreshed:
+                # Nothing to poll until the instance list has loaded once
+                next_poll = next_refresh
+            elif now >= next_poll:
+                try:
+                    batches = fetcher.fetch()
+                    eval_started = time.time()
+                    events = []
+                    for batch in batches:
+                        events.extend(engine.evaluate(batch))
+                    eval_seconds = time.time() - eval_started
+
+                    for event in events:
+                        notifier.add(event)
+
+                    points = sum(len(p) for batch in batches for p in batch.values())
+                    print(f"[{datetime.now()}] {len(fetcher.instance_ids)} instances, {points} new datapoints, "
+                          f"{len(events)} events, evaluated in {eval_seconds:.3f}s")
+                    next_poll = now + interval
+                except Exception as e:
+                    print(f"[{datetime.now()}] ❌ Metric poll failed: {e}")
+                    next_poll = now + retry_seconds
+
+            try:
+                notifier.maybe_flush()
+            except Exception as e:
+                print(f"[{datetime.now()}] ❌ Sending alert digest failed: {e}")
+
+            time.sleep(max(0, min(next_refresh, next_poll) - time.time()))
+    except KeyboardInterrupt:
+        notifier.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming EC2 alert monitor")
+    parser.add_argument("--rules", help="JSON file with alert rules (default: built-in rules)")
+    parser.add_argument("--to", help="Recipient email for digests (default: print to stdout)")
+    parser.add_argument("--interval", type=int, help="Seconds between polling cycles (default: --period)")
+    parser.add_argument("--period", type=int, default=300, help="CloudWatch metric period in seconds")
+    parser.add_argument("--window", type=int, default=300, help="Seconds of alerts batched into one digest")
+    parser.add_argument("--refresh", type=int, default=120, help="Seconds between reloads of the instance list")
+    args = parser.parse_args()
+
+    if args.to and not (SMTP_USER and SMTP_PASSWORD):
+        parser.error("--to requires SMTP_USER and SMTP_PASSWORD to be set")
+
+    notifier = Notifier(recipient_email=args.to, window_seconds=args.window)
+    run_monitor(load_rules(args.rules), notifier, interval=args.interval, period=args.period,
+                refresh_seconds=args.refresh)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import smtplib
+import time
+from collections import Counter, defaultdict
+from email.mime.text import MIMEText
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+
+# Max instances listed per rule in a digest; the rest are summarised as a count
+MAX_INSTANCES_PER_RULE = 25
+
+
+def send_email(subject, body, recipient_email):
+    """
+    Send an email using SMTP. Credentials come from SMTP_USER / SMTP_PASSWORD.
+    """
+    msg = MIMEText(body)
+    msg["Subject"] = subject
+    msg["From"] = SMTP_USER
+    msg["To"] = recipient_email
+
+    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+        server.starttls()
+        server.login(SMTP_USER, SMTP_PASSWORD)
+        server.send_message(msg)
+
+
+class Notifier:
+    """
+    Buffers alert events and sends them as one digest per time window.
+
+    However many instances fire in a window, at most one message is sent,
+    so notification cost stays flat as the fleet grows. Only the first
+    MAX_INSTANCES_PER_RULE events per (status, rule) are kept; the rest are
+    counted, so memory stays bounded while sending is failing.
+    """
+
+    def __init__(self, recipient_email=None, window_seconds=300, clock=time.time):
+        self.recipient_email = recipient_email
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.pending = []
+        self.counts = Counter()
+        self.window_start = None
+
+    def add(self, event):
+        """Queue an alert event (dict from monitor.AlertEngine)."""
+        if self.window_start is None:
+            self.window_start = self.clock()
+        key = (event["status"], event["rule"])
+        self.counts[key] += 1
+        if self.counts[key] <= MAX_INSTANCES_PER_RULE:
+            self.pending.append(event)
+
+    def due(self):
+        return self.window_start is not None and self.clock() - self.window_start >= self.window_seconds
+
+    def maybe_flush(self):
+        """Send the digest if the current window has elapsed."""
+        if self.due():
+            return self.flush()
+        return False
+
+    def flush(self):
+        """
+        Send all pending events as a single digest, regardless of the window.
+        If sending fails the events are kept and retried after another window.
+        """
+        if not self.pending:
+            self.window_start = None
+            return False
+
+        subject, body = build_digest(self.pending, self.counts)
+        if self.recipient_email:
+            try:
+                send_email(subject, body, self.recipient_email)
+            except Exception:
+                self.window_start = self.clock()
+                raise
+            print(f"Alert digest ({sum(self.counts.values())} events) sent to {self.recipient_email}")
+        else:
+            print(f"\n{subject}\n{body}")
+
+        self.pending = []
+        self.counts = Counter()
+        self.window_start = None
+        return True
+
+
+def build_digest(events, counts=None):
+    """
+    Group events by (status, rule) and format them as (subject, body).
+
+    `counts` gives the total events per (status, rule) when only a sample of
+    them was kept; by default every event is assumed to be present.
+    """
+    grouped = defaultdict(list)
+    for event in events:
+        grouped[(event["status"], event["rule"])].append(event)
+    if counts is None:
+        counts = Counter({key: len(items) for key, items in grouped.items()})
+
+    firing = sum(n for (status, _), n in counts.items() if status == "FIRING")
+    resolved = sum(counts.values()) - firing
+    subject = f"AWS Monitor: {firing} firing, {resolved} resolved"
+
+    lines = []
+    # FIRING sorts before RESOLVED
+    for (status, rule), total in sorted(counts.items()):
+        items = grouped[(status, rule)][:MAX_INSTANCES_PER_RULE]
+        lines.append(f"=== [{status}] {rule} ({total} instances) ===")
+        for e in items:
+            if e["value"] is None:
+                detail = e["metric"]
+            else:
+                detail = f"{e['metric']}={e['value']:.2f}"
+            if e.get("reason"):
+                detail += f" ({e['reason']})"
+            lines.append(f"  {e['instance_id']}: {detail} at {e['timestamp']}")
+        if total > len(items):
+            lines.append(f"  ... and {total - len(items)} more")
+        lines.append("")
+
+    return subject, "\n".join(lines)
@@ -0,0 +1,238 @@
+import random
+from datetime import timedelta
+
+import pytest
+
+import notifier
+from monitor import AlertEngine, MetricFetcher, Rule, load_rules
+from notifier import Notifier, build_digest
+
+CPU = ("AWS/EC2", "CPUUtilization", "Average")
+NET = ("AWS/EC2", "NetworkOut", "Average")
+
+
+def feed(engine, series, values, instance_id="i-1"):
+    """Evaluate one datapoint per value and return the statuses emitted each cycle."""
+    return [
+        [e["status"] for e in engine.evaluate({series: {instance_id: (t, v)}})]
+        for t, v in enumerate(values)
+    ]
+
+
+def test_threshold_fire_hold_clear():
+    engine = AlertEngine([Rule("high-cpu", "CPUUtilization", 80, clear=70, for_cycles=2)])
+    # 85 pending, 90 fires, 75/85 held by hysteresis, 60 clears, 85 pending again
+    assert feed(engine, CPU, [85, 90, 75, 85, 60, 85]) == [[], ["FIRING"], [], [], ["RESOLVED"], []]
+
+
+def test_below_threshold_rule():
+    engine = AlertEngine([Rule("low-cpu", "CPUUtilization", 10, clear=20, above=False)])
+    assert feed(engine, CPU, [5, 15, 25]) == [["FIRING"], [], ["RESOLVED"]]
+
+
+def test_broken_pending_streak_does_not_fire():
+    engine = AlertEngine([Rule("high-cpu", "CPUUtilization", 80, for_cycles=3)])
+    assert feed(engine, CPU, [90, 90, 50, 90, 90]) == [[], [], [], [], []]
+    assert feed(engine, CPU, [90]) == [["FIRING"]]
+
+
+def test_firing_alert_is_not_repeated():
+    engine = AlertEngine([Rule("high-cpu", "CPUUtilization", 80)])
+    assert feed(engine, CPU, [90, 95, 99, 90]) == [["FIRING"], [], [], []]
+
+
+def test_rate_rule():
+    engine = AlertEngine([Rule("spike", "NetworkOut", 300, clear=100, kind="rate")])
+    # No previous value, +100%, +400% fires, +150% held, -50% clears
+    assert feed(engine, NET, [100, 200, 1000, 2500, 1250]) == [[], [], ["FIRING"], [], ["RESOLVED"]]
+
+
+def test_rate_rule_skips_zero_previous_value():
+    engine = AlertEngine([Rule("spike", "NetworkOut", 300, kind="rate")])
+    assert feed(engine, NET, [0, 1000, 5000]) == [[], [], ["FIRING"]]
+
+
+def test_rules_are_evaluated_independently():
+    engine = AlertEngine([
+        Rule("warn", "CPUUtilization", 70),
+        Rule("crit", "CPUUtilization", 90, for_cycles=2),
+    ])
+    events = engine.evaluate({CPU: {"i-1": (0, 95)}})
+    assert [(e["rule"], e["status"]) for e in events] == [("warn", "FIRING")]
+    events = engine.evaluate({CPU: {"i-1": (1, 95)}})
+    assert [(e["rule"], e["status"]) for e in events] == [("crit", "FIRING")]
+
+
+def test_prune_resolves_firing_instances():
+    engine = AlertEngine([Rule("high-cpu", "CPUUtilization", 80)])
+    engine.evaluate({CPU: {"i-1": (0, 90), "i-2": (0, 90), "i-3": (0, 10)}})
+
+    events = engine.prune(["i-2", "i-3"])
+    assert [(e["instance_id"], e["status"], e["reason"]) for e in events] == [
+        ("i-1", "RESOLVED", "instance no longer running")
+    ]
+    # Surviving state is kept after compaction
+    assert feed(engine, CPU, [95], instance_id="i-2") == [[]]
+    assert feed(engine, CPU, [50], instance_id="i-2") == [["RESOLVED"]]
+    assert feed(engine, CPU, [90], instance_id="i-1") == [["FIRING"]]
+
+
+def test_load_rules_rejects_duplicate_names(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('[{"name": "cpu", "metric": "CPUUtilization", "threshold": 80},'
+                    ' {"name": "cpu", "metric": "CPUUtilization", "threshold": 90}]')
+    with pytest.raises(ValueError, match="cpu"):
+        load_rules(str(path))
+
+
+def test_rule_validation():
+    with pytest.raises(ValueError, match="for_cycles"):
+        Rule("cpu", "CPUUtilization", 80, for_cycles=0)
+    with pytest.raises(ValueError, match="clear"):
+        Rule("cpu", "CPUUtilization", 80, clear=90)
+    with pytest.raises(ValueError, match="clear"):
+        Rule("cpu", "CPUUtilization", 10, clear=5, above=False)
+
+
+def test_alert_storm_steady_firing_emits_nothing():
+    """Timing for this case lives in bench_monitor.py."""
+    engine = AlertEngine([Rule(f"cpu-{n}", "CPUUtilization", 80, clear=70, for_cycles=2)
+                          for n in range(30)])
+    instance_ids = [f"i-{n}" for n in range(1000)]
+    rng = random.Random(0)
+
+    for cycle in range(4):
+        engine.evaluate({CPU: {i: (cycle, rng.uniform(0, 100)) for i in instance_ids}})
+
+    batch = {CPU: {i: (4, 95.0) for i in instance_ids}}
+    engine.evaluate(batch)
+    engine.evaluate(batch)
+    assert engine.evaluate(batch) == []
+
+
+class FakeCloudWatch:
+    """Returns one datapoint per period in the requested window."""
+
+    def __init__(self, period=300, fail_on_call=None):
+        self.period = period
+        self.fail_on_call = fail_on_call
+        self.calls = []
+
+    def get_metric_data(self, **kwargs):
+        self.calls.append(kwargs)
+        if len(self.calls) == self.fail_on_call:
+            raise RuntimeError("throttled")
+        timestamps = []
+        t = kwargs["StartTime"]
+        while t < kwargs["EndTime"]:
+            timestamps.append(t)
+            t += timedelta(seconds=self.period)
+        return {"MetricDataResults": [
+            {"Id": q["Id"], "Timestamps": timestamps, "Values": [float(n) for n in range(len(timestamps))]}
+            for q in kwargs["MetricDataQueries"]
+        ]}
+
+
+def make_fetcher(instances, cloudwatch):
+    fetcher = MetricFetcher([CPU], period=300)
+    fetcher.cloudwatch = cloudwatch
+    fetcher.instance_ids = [f"i-{n}" for n in range(instances)]
+    return fetcher
+
+
+def test_fetch_uses_finished_periods_only():
+    fetcher = make_fetcher(600, FakeCloudWatch())
+
+    batches = fetcher.fetch()
+    # 600 queries are split into two requests ending on a period boundary
+    assert [len(c["MetricDataQueries"]) for c in fetcher.cloudwatch.calls] == [500, 100]
+    assert fetcher.cloudwatch.calls[0]["EndTime"].timestamp() % 300 == 0
+
+    # Every datapoint in the window is returned, oldest first
+    assert len(batches) == 3
+    timestamps = [next(iter(b[CPU].values()))[0] for b in batches]
+    assert timestamps == sorted(timestamps)
+    assert all(len(b[CPU]) == 600 for b in batches)
+
+    # Within the same period nothing new is requested
+    assert fetcher.fetch() == []
+    assert len(fetcher.cloudwatch.calls) == 2
+
+
+def test_fetch_failure_is_retried_next_cycle():
+    fetcher = make_fetcher(600, FakeCloudWatch(fail_on_call=2))
+    with pytest.raises(RuntimeError):
+        fetcher.fetch()
+    assert fetcher.last_end is None
+
+    batches = fetcher.fetch()
+    assert len(batches) == 3 and all(len(b[CPU]) == 600 for b in batches)
+
+
+def make_event(status, rule, instance_id, value=90.0, reason=None):
+    return {"status": status, "rule": rule, "metric": "CPUUtilization", "instance_id": instance_id,
+            "value": value, "timestamp": 0, "reason": reason}
+
+
+def test_digest_groups_and_truncates():
+    events = [make_event("FIRING", "high-cpu", f"i-{n}") for n in range(notifier.MAX_INSTANCES_PER_RULE + 5)]
+    events.append(make_event("RESOLVED", "high-cpu", "i-x", value=None, reason="instance no longer running"))
+
+    subject, body = build_digest(events)
+    assert subject == f"AWS Monitor: {notifier.MAX_INSTANCES_PER_RULE + 5} firing, 1 resolved"
+    assert body.index("[FIRING] high-cpu") < body.index("[RESOLVED] high-cpu")
+    assert f"({notifier.MAX_INSTANCES_PER_RULE + 5} instances)" in body
+    assert "... and 5 more" in body
+    assert "i-x: CPUUtilization (instance no longer running)" in body
+
+
+def test_notifier_batches_per_window(monkeypatch):
+    sent = []
+    monkeypatch.setattr(notifier, "send_email", lambda subject, body, to: sent.append(subject))
+    now = [0]
+    n = Notifier(recipient_email="ops@example.com", window_seconds=300, clock=lambda: now[0])
+
+    n.add(make_event("FIRING", "high-cpu", "i-1"))
+    now[0] = 100
+    n.add(make_event("FIRING", "high-cpu", "i-2"))
+    assert not n.maybe_flush()
+    now[0] = 300
+    assert n.maybe_flush()
+    assert sent == ["AWS Monitor: 2 firing, 0 resolved"]
+
+
+def test_notifier_caps_pending_events():
+    n = Notifier(window_seconds=300, clock=lambda: 0)
+    for i in range(1000):
+        n.add(make_event("FIRING", "high-cpu", f"i-{i}"))
+    n.add(make_event("RESOLVED", "high-cpu", "i-x"))
+    assert len(n.pending) == notifier.MAX_INSTANCES_PER_RULE + 1
+
+    subject, body = build_digest(n.pending, n.counts)
+    assert subject == "AWS Monitor: 1000 firing, 1 resolved"
+    assert "(1000 instances)" in body
+    assert f"... and {1000 - notifier.MAX_INSTANCES_PER_RULE} more" in body
+
+
+def test_notifier_keeps_events_when_send_fails(monkeypatch):
+    def fail(subject, body, to):
+        raise OSError("smtp down")
+
+    monkeypatch.setattr(notifier, "send_email", fail)
+    now = [0]
+    n = Notifier(recipient_email="ops@example.com", window_seconds=300, clock=lambda: now[0])
+    n.add(make_event("FIRING", "high-cpu", "i-1"))
+
+    now[0] = 300
+    with pytest.raises(OSError):
+        n.maybe_flush()
+    assert len(n.pending) == 1
+    # Retried after another window, not on every cycle
+    now[0] = 400
+    assert not n.due()
+
+    sent = []
+    monkeypatch.setattr(notifier, "send_email", lambda subject, body, to: sent.append(subject))
+    now[0] = 600
+    assert n.maybe_flush()
+    assert n.pending == [] and len(sent) == 1